@@ -20,10 +20,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import json
+import hashlib
+import sqlite3
+import threading
 from pathlib import Path
 from typing import Any
 
+import orjson
 from xdg import xdg_config_home
 
 from util import PACKAGE_NAME
@@ -37,22 +40,20 @@ class Config:
         self._config_path = xdg_config_home() / PACKAGE_NAME
         self._config_file = self._config_path / "config.json"
 
+        self._cache_file = self._config_path / "cache.sqlite"
+        self._cache: sqlite3.Connection | None = None
+        self._cache_lock = threading.Lock()
+
+        # Older versions cached into one JSON file per movie/show in these directories
         self._movies_path = self._config_path / "movies"
         self._shows_path = self._config_path / "shows"
 
     @staticmethod
     def _get_config_key(config: dict[Any, Any], key: str, default: Any):
-        if key not in config:
-            return default
-
-        value = config[key]
-        if value is None or not value:
+        value = config.get(key)
+        if not value or (isinstance(value, str) and not value.strip()):
             return default
 
-        if isinstance(value, str):
-            if value.strip() == "":
-                return default
-
         return value
 
     def get_program_config(self) -> dict[Any, Any]:
@@ -76,22 +77,22 @@ class Config:
         if not self._config_file.exists():
             return config
 
-        with open(self._config_file, 'rb') as f:
-            saved_config = json.load(f)
+        saved_config = orjson.loads(self._config_file.read_bytes())
 
-        config["tmdb"] = self._get_config_key(saved_config, "tmdb", config["tmdb"])
-        config["movies"] = self._get_config_key(saved_config, "movies", config["movies"])
-        config["shows"] = self._get_config_key(saved_config, "shows", config["shows"])
+        for key in ("tmdb", "movies", "shows"):
+            config[key] = self._get_config_key(saved_config, key, config[key])
 
-        if "email" in saved_config:
-            config["email"]["host"] = self._get_config_key(saved_config["email"], "host", config["email"]["host"])
-            config["email"]["port"] = self._get_config_key(saved_config["email"], "port", config["email"]["port"])
-            config["email"]["from"] = self._get_config_key(saved_config["email"], "from", config["email"]["from"])
-            config["email"]["to"] = self._get_config_key(saved_config["email"], "to", config["email"]["to"])
+        saved_email = saved_config.get("email") or {}
+        config["email"] = {key: self._get_config_key(saved_email, key, default)
+                           for key, default in config["email"].items()}
 
         if isinstance(config["email"]["to"], str):
             config["email"]["to"] = [config["email"]["to"]]
 
+        # Drop duplicate IDs (keeping the order), so each movie/show is only queried once per run
+        config["movies"] = list(dict.fromkeys(config["movies"]))
+        config["shows"] = list(dict.fromkeys(config["shows"]))
+
         return config
 
     def get_program_config_path(self) -> Path:
@@ -102,17 +103,120 @@ class Config:
 
         return self._config_file
 
-    def _get_movie_file(self, movie_id: int) -> Path:
-        return self._movies_path / (str(movie_id) + ".json")
+    @staticmethod
+    def _import_legacy_cache(cache: sqlite3.Connection, table: str, path: Path) -> None:
+        if not path.is_dir():
+            return
+
+        # No single bad file may block the import, or every following run would fail on it, too:
+        # - Older versions only wrote files named after the TMDB ID. Leave anything else alone,
+        #   including names with digits int() doesn't parse, like superscripts
+        # - Files that can't be read are left alone as well
+        # - Files could be left truncated by a crash during the non-atomic writes of older versions.
+        #   Treat them as not cached, so they're fetched and cached anew
+        files = [f for f in path.glob("*.json") if f.stem.isdecimal()]
+        processed: list[Path] = []
+
+        with cache:
+            for f in files:
+                try:
+                    raw = f.read_bytes()
+                except OSError:
+                    continue
+
+                processed.append(f)
+
+                try:
+                    data = orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    continue
+
+                cache.execute(f"INSERT OR IGNORE INTO {table} (id, hash, data) VALUES (?, ?, ?)",
+                              (int(f.stem), Config.hash_cache_entry(data), orjson.dumps(data)))
+
+        # Everything is in the cache now, and importing again is harmless, so failing to clean up is, too
+        for f in processed:
+            try:
+                f.unlink()
+            except OSError:
+                pass
+
+        try:
+            if not any(path.iterdir()):
+                path.rmdir()
+        except OSError:
+            pass
+
+    def _get_cache(self) -> sqlite3.Connection:
+        # Must be called with the cache lock held
+        if self._cache is not None:
+            return self._cache
+
+        self._config_path.mkdir(parents=True, exist_ok=True)
+
+        cache = sqlite3.connect(self._cache_file, check_same_thread=False)
+        cache.execute("PRAGMA journal_mode=WAL")
+        cache.execute("PRAGMA synchronous=NORMAL")
+
+        with cache:
+            cache.execute("CREATE TABLE IF NOT EXISTS movie_cache "
+                          "(id INTEGER PRIMARY KEY, hash TEXT NOT NULL, data BLOB NOT NULL)")
+            cache.execute("CREATE TABLE IF NOT EXISTS show_cache "
+                          "(id INTEGER PRIMARY KEY, hash TEXT NOT NULL, data BLOB NOT NULL)")
+
+        self._import_legacy_cache(cache, "movie_cache", self._movies_path)
+        self._import_legacy_cache(cache, "show_cache", self._shows_path)
+
+        self._cache = cache
+        return cache
+
+    def _get_cached(self, table: str, tmdb_id: int) -> dict[Any, Any]:
+        with self._cache_lock:
+            row = self._get_cache().execute(f"SELECT data FROM {table} WHERE id = ?", (tmdb_id,)).fetchone()
+
+        if row is None:
+            return {}
+
+        return orjson.loads(row[0])
+
+    def _get_cached_hash(self, table: str, tmdb_id: int) -> str | None:
+        with self._cache_lock:
+            row = self._get_cache().execute(f"SELECT hash FROM {table} WHERE id = ?", (tmdb_id,)).fetchone()
 
-    def _get_show_file(self, show_id: int) -> Path:
-        return self._shows_path / (str(show_id) + ".json")
+        if row is None:
+            return None
 
-    def _create_movie_path(self) -> None:
-        self._movies_path.mkdir(parents=True, exist_ok=True)
+        return row[0]
 
-    def _create_show_path(self) -> None:
-        self._shows_path.mkdir(parents=True, exist_ok=True)
+    def _put_cached(self, table: str, tmdb_id: int, data: dict[Any, Any]) -> None:
+        data_hash = Config.hash_cache_entry(data)
+
+        # Commit every entry right away: an email has already been sent for it
+        with self._cache_lock:
+            cache = self._get_cache()
+            with cache:
+                cache.execute(f"INSERT OR REPLACE INTO {table} (id, hash, data) VALUES (?, ?, ?)",
+                              (tmdb_id, data_hash, orjson.dumps(data)))
+
+    @staticmethod
+    def hash_cache_entry(data: dict[Any, Any]) -> str:
+        """! Return the hash of movie or show information, as stored in the cache.
+
+        @param data  Movie or show information.
+
+        @return The SHA-256 hash of the information in canonical JSON form, as a hex string.
+        """
+
+        return hashlib.sha256(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def close(self) -> None:
+        """! Close the cache database, if it was opened.
+        """
+
+        with self._cache_lock:
+            if self._cache is not None:
+                self._cache.close()
+                self._cache = None
 
     def get_cached_movie(self, movie_id: int) -> dict[Any, Any]:
         """! Return the cached information for a single movie.
@@ -122,12 +226,17 @@ class Config:
         @return A dict with the cached movie details.
         """
 
-        movie_file = self._get_movie_file(movie_id)
-        if not movie_file.exists():
-            return {}
+        return self._get_cached("movie_cache", movie_id)
+
+    def get_cached_movie_hash(self, movie_id: int) -> str | None:
+        """! Return the hash of the cached information for a single movie.
+
+        @param movie_id  ID of the movie.
+
+        @return The hash of the cached movie details, or None if the movie isn't cached.
+        """
 
-        with open(movie_file, 'rb') as f:
-            return json.load(f)
+        return self._get_cached_hash("movie_cache", movie_id)
 
     def put_cached_movie(self, movie_id: int, movie: dict[Any, Any]) -> None:
         """! Save the given movie information into the cache.
@@ -136,11 +245,7 @@ class Config:
         @param movie     Movie information to cache.
         """
 
-        self._create_movie_path()
-
-        movie_file = self._get_movie_file(movie_id)
-        with open(movie_file, "w", encoding="utf-8") as f:
-            json.dump(movie, f, ensure_ascii=False, indent=4)
+        self._put_cached("movie_cache", movie_id, movie)
 
     def get_cached_show(self, show_id: int) -> dict[Any, Any]:
         """! Return the cached information for a single show.
@@ -150,12 +255,17 @@ class Config:
         @return A dict with the cached show details.
         """
 
-        show_file = self._get_show_file(show_id)
-        if not show_file.exists():
-            return {}
+        return self._get_cached("show_cache", show_id)
+
+    def get_cached_show_hash(self, show_id: int) -> str | None:
+        """! Return the hash of the cached information for a single show.
+
+        @param show_id  ID of the show.
+
+        @return The hash of the cached show details, or None if the show isn't cached.
+        """
 
-        with open(show_file, 'rb') as f:
-            return json.load(f)
+        return self._get_cached_hash("show_cache", show_id)
 
     def put_cached_show(self, show_id: int, show: dict[Any, Any]) -> None:
         """! Save the given show information into the cache.
@@ -164,8 +274,4 @@ class Config:
         @param show     Movie information to cache.
         """
 
-        self._create_show_path()
-
-        show_file = self._get_show_file(show_id)
-        with open(show_file, "w", encoding="utf-8") as f:
-            json.dump(show, f, ensure_ascii=False, indent=4)
+        self._put_cached("show_cache", show_id, show)
@@ -24,7 +24,6 @@ import argparse
 import sys
 from typing import Any
 
-from monitor_movie_show_releases import MonitorMovieShowReleases
 from util import Util
 
 
@@ -53,6 +52,12 @@ class Main:  # pylint: disable=too-few-public-methods
 
         @return An object containing the parsed command line arguments.
         """
+
+        # Without any arguments (the common case, when run from cron), there's nothing to parse.
+        # Skip setting up the parser, which also needs to read the project metadata
+        if len(sys.argv) == 1:
+            return argparse.Namespace(version=False)
+
         info: dict[str, Any] = Util.get_project_info()
         nameversion: str = f"{info['name']} {info['version']}"
         description: str = f"{nameversion} -- {info['summary']}"
@@ -79,6 +84,9 @@ class Main:  # pylint: disable=too-few-public-methods
         """
         Main._parse_args()
 
+        # Only import the actual logic (and its dependencies) now, after --version was handled
+        from monitor_movie_show_releases import MonitorMovieShowReleases  # pylint: disable=import-outside-toplevel
+
         monitor_movie_show_releases: MonitorMovieShowReleases = MonitorMovieShowReleases()
         return monitor_movie_show_releases.run()
 
@@ -20,18 +20,26 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import difflib
-import json
 import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
+from functools import partial
 from typing import Any
 
-import dictdiffer
+import orjson
 
 from config import Config
 from sendmail import SendMail
 from tmdb import TMDB
 
+# How many movies/shows to check concurrently
+MAX_WORKERS = 8
+
+# Check movies/shows in batches, waiting between them, to stay within TMDB's rate limit
+BATCH_SIZE = 10
+BATCH_DELAY = 2
+
 
 class ReleaseType(IntEnum):
     """! Different types of releases.
@@ -45,65 +53,99 @@ class ReleaseType(IntEnum):
     TV = 6
 
 
+_RELEASE_TYPE_NAMES: dict[int, str] = {release_type.value: release_type.name for release_type in ReleaseType}
+
+
 class MonitorMovieShowReleases:  # pylint: disable=too-few-public-methods
     """! Monitor Movie and Show Releases logic.
     """
 
     def __init__(self) -> None:
-        self._tmdb: TMDB | None = None
-        self._sendmail: SendMail | None = None
+        self._next_batch: float = 0.0
+
+    @staticmethod
+    def _get_changed_keys(diff: list[Any]) -> set[Any]:
+        keys: set[Any] = set()
+        for _, path, changes in diff:
+            if path in ("", []):
+                # Additions and removals at the top level carry the affected keys in their changes
+                keys.update(key for key, _ in changes)
+            else:
+                # dictdiffer gives the path as a dotted string if possible, as a list otherwise
+                keys.add(path[0] if isinstance(path, list) else path.split(".")[0])
+
+        return keys
+
+    @staticmethod
+    def _dict_to_lines(data: dict[Any, Any], keys: set[Any]) -> list[str]:
+        subset = {key: value for key, value in data.items() if key in keys}
+        return orjson.dumps(subset, option=orjson.OPT_INDENT_2).decode().splitlines()
 
     @staticmethod
-    def _format_unified_dict_diff(old: dict[Any, Any], new: dict[Any, Any], tmdb_id: int) -> str:
-        str_old = json.dumps(old, indent=4)
-        str_new = json.dumps(new, indent=4)
+    def _format_unified_dict_diff(lines_old: list[str], lines_new: list[str], tmdb_id: int) -> str:
+        import difflib  # pylint: disable=import-outside-toplevel
 
-        return '\n'.join(difflib.unified_diff(str_old.splitlines(), str_new.splitlines(),
+        return '\n'.join(difflib.unified_diff(lines_old, lines_new,
                                               fromfile=f'{tmdb_id}.json.old', tofile=f'{tmdb_id}.json.new',
                                               lineterm='')) + '\n'
 
     @staticmethod
     def _format_dict_diff(diff: list[Any]) -> str:
-        formatted = ''
-        for change in diff:
-            formatted += str(change) + '\n'
-
-        return formatted
+        return ''.join(f'{change}\n' for change in diff)
 
     @staticmethod
     def _format_movie_change(movie_old: dict[Any, Any], movie_new: dict[Any, Any]) -> tuple[bool, str, str]:
+        # The plain comparison is much cheaper than dictdiffer, which is only needed to describe a change
+        if movie_old == movie_new:
+            return False, "", ""
+
+        # Only needed when there's a change, which most runs don't have
+        import dictdiffer  # pylint: disable=import-outside-toplevel
+
         movie_diff = list(dictdiffer.diff(movie_old, movie_new))
         if not movie_diff:
             return False, "", ""
 
         subject = f'Change in movie "{movie_new["title"]}" ({movie_new["id"]})'
 
-        body = ''
-        body = f'https://www.themoviedb.org/movie/{movie_new["id"]}\n\n'
-        body += f'Title: {movie_new["title"]}\n'
-        body += f'Status: {movie_new["status"]}\n\n'
+        body: list[str] = []
+        body.append(f'https://www.themoviedb.org/movie/{movie_new["id"]}\n\n')
+        body.append(f'Title: {movie_new["title"]}\n')
+        body.append(f'Status: {movie_new["status"]}\n\n')
         for release in movie_new["release_dates"]:
-            body += f'Release({release["type"]}, {release["iso_639_1"]}): {release["release_date"]}\n'
+            body.append(f'Release({release["type"]}, {release["iso_639_1"]}): {release["release_date"]}\n')
+
+        # Only diff the parts that actually changed
+        changed_keys = MonitorMovieShowReleases._get_changed_keys(movie_diff)
+        lines_old = MonitorMovieShowReleases._dict_to_lines(movie_old, changed_keys)
+        lines_new = MonitorMovieShowReleases._dict_to_lines(movie_new, changed_keys)
 
-        body += '\n------\n\n'
-        body += MonitorMovieShowReleases._format_unified_dict_diff(movie_old, movie_new, movie_new["id"])
-        body += '\n------\n\n'
-        body += MonitorMovieShowReleases._format_dict_diff(movie_diff)
+        body.append('\n------\n\n')
+        body.append(MonitorMovieShowReleases._format_unified_dict_diff(lines_old, lines_new, movie_new["id"]))
+        body.append('\n------\n\n')
+        body.append(MonitorMovieShowReleases._format_dict_diff(movie_diff))
 
-        return True, subject, body
+        return True, subject, ''.join(body)
 
     @staticmethod
     def _format_show_change(show_old: dict[Any, Any], show_new: dict[Any, Any]) -> tuple[bool, str, str]:
+        # The plain comparison is much cheaper than dictdiffer, which is only needed to describe a change
+        if show_old == show_new:
+            return False, "", ""
+
+        # Only needed when there's a change, which most runs don't have
+        import dictdiffer  # pylint: disable=import-outside-toplevel
+
         show_diff = list(dictdiffer.diff(show_old, show_new))
         if not show_diff:
             return False, "", ""
 
         subject = f'Change in show "{show_new["title"]}" ({show_new["id"]})'
 
-        body = ''
-        body = f'https://www.themoviedb.org/tv/{show_new["id"]}\n\n'
-        body += f'Title: {show_new["title"]}\n'
-        body += f'Status: {show_new["status"]}\n\n'
+        body: list[str] = []
+        body.append(f'https://www.themoviedb.org/tv/{show_new["id"]}\n\n')
+        body.append(f'Title: {show_new["title"]}\n')
+        body.append(f'Status: {show_new["status"]}\n\n')
 
         next_episode = show_new["next_episode_to_air"]
         if next_episode is not None:
@@ -113,61 +155,58 @@ class MonitorMovieShowReleases:  # pylint: disable=too-few-public-methods
             episode_id = next_episode.get("id", 0)
             date = next_episode.get("air_date", "")
 
-            body += f'Next to air: {season}x{episode:02} - {name} ({episode_id})  --  {date}\n'
+            body.append(f'Next to air: {season}x{episode:02} - {name} ({episode_id})  --  {date}\n')
+
+        # Only diff the parts that actually changed
+        changed_keys = MonitorMovieShowReleases._get_changed_keys(show_diff)
+        lines_old = MonitorMovieShowReleases._dict_to_lines(show_old, changed_keys)
+        lines_new = MonitorMovieShowReleases._dict_to_lines(show_new, changed_keys)
 
-        body += '\n------\n\n'
-        body += MonitorMovieShowReleases._format_unified_dict_diff(show_old, show_new, show_new["id"])
-        body += '\n------\n\n'
-        body += MonitorMovieShowReleases._format_dict_diff(show_diff)
+        body.append('\n------\n\n')
+        body.append(MonitorMovieShowReleases._format_unified_dict_diff(lines_old, lines_new, show_new["id"]))
+        body.append('\n------\n\n')
+        body.append(MonitorMovieShowReleases._format_dict_diff(show_diff))
 
-        return True, subject, body
+        return True, subject, ''.join(body)
 
     @staticmethod
     def _describe_release_type(type_id: int) -> str:
-        if type_id not in ReleaseType:
-            return "Unknown"
-
-        return ReleaseType(type_id).name
+        return _RELEASE_TYPE_NAMES.get(type_id, "Unknown")
 
     @staticmethod
-    def _filter_release_dates_by_country(movie: dict[Any, Any], country: str) -> list[dict[Any, Any]]:
-        if "release_dates" not in movie or "results" not in movie["release_dates"]:
-            return []
+    def _filter_release_dates_by_countries(movie: dict[Any, Any], countries: tuple[str, ...]) -> list[dict[Any, Any]]:
+        results = movie.get("release_dates", {}).get("results", [])
+        by_country = {r["iso_3166_1"]: r["release_dates"] for r in results}
 
-        country_releases = list(filter(lambda r: r["iso_3166_1"] == country, movie["release_dates"]["results"]))
-        if not country_releases:
-            return []
+        # Use the releases of the first country in the list that has any
+        for country in countries:
+            releases = by_country.get(country)
+            if releases:
+                for release in releases:
+                    release["type"] = MonitorMovieShowReleases._describe_release_type(release["type"])
+                    release["iso_639_1"] = country
 
-        releases = country_releases[0]["release_dates"]
-        for release in releases:
-            release["type"] = MonitorMovieShowReleases._describe_release_type(release["type"])
-            release["iso_639_1"] = country
+                return releases
 
-        return releases
+        return []
 
-    def _get_movie_info(self, movie_id: int) -> dict[Any, Any]:
-        assert self._tmdb is not None
-        movie = self._tmdb.get_movie(movie_id)
+    @staticmethod
+    def _get_movie_info(tmdb: TMDB, movie_id: int) -> dict[Any, Any]:
+        movie = tmdb.get_movie(movie_id, append=["release_dates"])
 
         movie_info: dict[Any, Any] = {}
 
         movie_info["id"] = movie_id
         movie_info["title"] = movie.get("title", "")
         movie_info["status"] = movie.get("status", "")
-        movie_info["release_dates"] = []
-
-        if not movie_info["release_dates"]:
-            movie_info["release_dates"] = self._filter_release_dates_by_country(movie, "US")
-        if not movie_info["release_dates"]:
-            movie_info["release_dates"] = self._filter_release_dates_by_country(movie, "GB")
-        if not movie_info["release_dates"]:
-            movie_info["release_dates"] = self._filter_release_dates_by_country(movie, "DE")
+        movie_info["release_dates"] = \
+            MonitorMovieShowReleases._filter_release_dates_by_countries(movie, ("US", "GB", "DE"))
 
         return movie_info
 
-    def _get_show_info(self, show_id: int) -> dict[Any, Any]:
-        assert self._tmdb is not None
-        show = self._tmdb.get_show(show_id)
+    @staticmethod
+    def _get_show_info(tmdb: TMDB, show_id: int) -> dict[Any, Any]:
+        show = tmdb.get_show(show_id)
 
         show_info: dict[Any, Any] = {}
 
@@ -177,45 +216,62 @@ class MonitorMovieShowReleases:  # pylint: disable=too-few-public-methods
         show_info["next_episode_to_air"] = show.get("next_episode_to_air", None)
         return show_info
 
-    def _check_movie(self, movie_id: int, config: Config, email_to: list[str]) -> None:
-        print(f"Checking movie {movie_id}... ", end='', flush=True)
-
-        movie_info_cached = config.get_cached_movie(movie_id)
-        movie_info = self._get_movie_info(movie_id)
+    @staticmethod
+    def _check_movie(movie_id: int, tmdb: TMDB, sendmail: SendMail, config: Config, email_to: list[str]) -> str:
+        movie_info = MonitorMovieShowReleases._get_movie_info(tmdb, movie_id)
 
-        print(f'"{movie_info["title"]}"... ', end='', flush=True)
+        # A matching hash means no change, without having to load and diff the cached information
+        if config.get_cached_movie_hash(movie_id) == Config.hash_cache_entry(movie_info):
+            return f'Checking movie {movie_id}... "{movie_info["title"]}"... no change'
 
-        changed, subject, body = self._format_movie_change(movie_info_cached, movie_info)
+        movie_info_cached = config.get_cached_movie(movie_id)
+        changed, subject, body = MonitorMovieShowReleases._format_movie_change(movie_info_cached, movie_info)
 
         if changed:
-            print("change")
-            assert self._sendmail is not None
-            for address in email_to:
-                self._sendmail.send(address, subject, body)
+            sendmail.send(email_to, subject, body)
 
             config.put_cached_movie(movie_id, movie_info)
-        else:
-            print("no change")
 
-    def _check_show(self, show_id: int, config: Config, email_to: list[str]) -> None:
-        print(f"Checking show {show_id}... ", end='', flush=True)
+        return f'Checking movie {movie_id}... "{movie_info["title"]}"... {"change" if changed else "no change"}'
 
-        show_info_cached = config.get_cached_show(show_id)
-        show_info = self._get_show_info(show_id)
+    @staticmethod
+    def _check_show(show_id: int, tmdb: TMDB, sendmail: SendMail, config: Config, email_to: list[str]) -> str:
+        show_info = MonitorMovieShowReleases._get_show_info(tmdb, show_id)
 
-        print(f'"{show_info["title"]}"... ', end='', flush=True)
+        # A matching hash means no change, without having to load and diff the cached information
+        if config.get_cached_show_hash(show_id) == Config.hash_cache_entry(show_info):
+            return f'Checking show {show_id}... "{show_info["title"]}"... no change'
 
-        changed, subject, body = self._format_show_change(show_info_cached, show_info)
+        show_info_cached = config.get_cached_show(show_id)
+        changed, subject, body = MonitorMovieShowReleases._format_show_change(show_info_cached, show_info)
 
         if changed:
-            print("change")
-            assert self._sendmail is not None
-            for address in email_to:
-                self._sendmail.send(address, subject, body)
+            sendmail.send(email_to, subject, body)
 
             config.put_cached_show(show_id, show_info)
-        else:
-            print("no change")
+
+        return f'Checking show {show_id}... "{show_info["title"]}"... {"change" if changed else "no change"}'
+
+    def _check_all(self, check: Callable[[int], str], ids: list[int]) -> None:
+        count = len(ids)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for start in range(0, count, BATCH_SIZE):
+                # The delay starts with the previous batch, so only wait for what's left after checking it
+                delay = self._next_batch - time.monotonic()
+                if delay > 0:
+                    print("Waiting for a bit... ", end='', flush=True)
+                    time.sleep(delay)
+                    print("done")
+
+                self._next_batch = time.monotonic() + BATCH_DELAY
+
+                batch = ids[start:start + BATCH_SIZE]
+                results = executor.map(check, batch)
+
+                # Results come back in order, so the progress output stays the same as when checking serially
+                for n, result in enumerate(results, start + 1):
+                    print(f'{n}/{count}: {result}', flush=True)
 
     def run(self) -> int:
         """! Run the main logic.
@@ -232,27 +288,22 @@ class MonitorMovieShowReleases:  # pylint: disable=too-few-public-methods
         if not program_config["movies"] and not program_config["shows"]:
             print("Nothing to do.")
 
-        self._sendmail = SendMail(program_config["email"]["host"],
-                                  program_config["email"]["port"],
-                                  program_config["email"]["from"])
-        self._tmdb = TMDB(program_config["tmdb"])
-
-        for n, movie in enumerate(program_config["movies"]):
-            if n % 10 == 0:
-                print("Waiting for a bit... ", end='', flush=True)
-                time.sleep(2)
-                print("done")
-
-            print(f'{n + 1}/{len(program_config["movies"])}: ', end='', flush=True)
-            self._check_movie(movie, config, program_config["email"]["to"])
-
-        for n, show in enumerate(program_config["shows"]):
-            if n % 10 == 0:
-                print("Waiting for a bit... ", end='', flush=True)
-                time.sleep(2)
-                print("done")
-
-            print(f'{n + 1}/{len(program_config["shows"])}: ', end='', flush=True)
-            self._check_show(show, config, program_config["email"]["to"])
+        print("Trying to authenticate with TMDB...")
+        tmdb = TMDB(program_config["tmdb"])
+
+        email_to = program_config["email"]["to"]
+
+        try:
+            with SendMail(program_config["email"]["host"],
+                          program_config["email"]["port"],
+                          program_config["email"]["from"]) as sendmail:
+                self._check_all(partial(self._check_movie, tmdb=tmdb, sendmail=sendmail, config=config,
+                                        email_to=email_to),
+                                program_config["movies"])
+                self._check_all(partial(self._check_show, tmdb=tmdb, sendmail=sendmail, config=config,
+                                        email_to=email_to),
+                                program_config["shows"])
+        finally:
+            config.close()
 
         return 0
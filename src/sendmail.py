@@ -20,32 +20,110 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import queue
+import threading
 from email.message import EmailMessage
 from smtplib import SMTP
+from types import TracebackType
 
 
-class SendMail:  # pylint: disable=too-few-public-methods
+class SendMail:
     """! Sending email.
+
+    Connections to the SMTP server are kept in a small pool, so that several emails can be sent
+    concurrently and connections are reused for following emails. They are opened as needed,
+    replaced after a number of emails, and closed when close() is called or the context is left.
     """
 
-    def __init__(self, host: str, port: int, sender: str) -> None:
+    def __init__(self, host: str, port: int, sender: str, pool_size: int = 4, max_msgs_per_conn: int = 100) -> None:
         self._host = host
         self._port = port
         self._sender = sender
+        self._max_msgs_per_conn = max_msgs_per_conn
+
+        # Idle connections, together with the number of emails already sent over them
+        self._idle: queue.LifoQueue[tuple[SMTP, int]] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def __enter__(self) -> "SendMail":
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None,
+                 traceback: TracebackType | None) -> None:
+        self.close()
+
+    @staticmethod
+    def _disconnect(smtp: SMTP) -> None:
+        try:
+            smtp.quit()
+        except OSError:
+            # The connection is already gone, just clean up
+            smtp.close()
+
+    @staticmethod
+    def _is_connected(smtp: SMTP) -> bool:
+        # Make sure the server hasn't closed the connection on us in the meantime
+        try:
+            return smtp.noop()[0] == 250
+        except OSError:
+            return False
+
+    def _acquire_connection(self) -> tuple[SMTP, int]:
+        # Must be called with a slot held
+        while True:
+            try:
+                smtp, sent = self._idle.get_nowait()
+            except queue.Empty:
+                return SMTP(host=self._host, port=self._port), 0
+
+            if self._is_connected(smtp):
+                return smtp, sent
+
+            self._disconnect(smtp)
 
-    def send(self, receiver: str, subject: str, body: str) -> None:
+    def _release_connection(self, smtp: SMTP, sent: int) -> None:
+        if sent >= self._max_msgs_per_conn:
+            self._disconnect(smtp)
+        else:
+            self._idle.put((smtp, sent))
+
+    def close(self) -> None:
+        """! Close all idle connections to the SMTP server.
+        """
+
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            self._disconnect(smtp)
+
+    def send(self, receivers: list[str], subject: str, body: str) -> None:
         """! Send an email.
 
-        @param receiver  The address to which to send the email to.
-        @param subject   The email subject.
-        @param body      The email body.
+        @param receivers  The addresses to which to send the email to.
+        @param subject    The email subject.
+        @param body       The email body.
         """
 
+        if not receivers:
+            return
+
         msg = EmailMessage()
         msg.set_content(body)
         msg['From'] = self._sender
-        msg['To'] = receiver
+        msg['To'] = ", ".join(receivers)
         msg['Subject'] = subject
 
-        with SMTP(host=self._host, port=self._port) as smtp:
-            smtp.send_message(msg)
+        with self._slots:
+            smtp, sent = self._acquire_connection()
+
+            try:
+                smtp.send_message(msg)
+            except BaseException:
+                # We don't know what state the connection is in now, so don't reuse it
+                self._disconnect(smtp)
+                raise
+
+            self._release_connection(smtp, sent + 1)
@@ -20,18 +20,31 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from http import HTTPStatus
 from typing import Any
+from urllib.parse import quote
 
+import orjson
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
+# Retry strategy for all TMDB queries. Retry objects are never modified in place, so this can be shared
+_RETRIES = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=frozenset(["GET"]))
+
 
 class TMDB:  # pylint: disable=too-few-public-methods
     """! Interacting with The Movie Database (TMDB).
     """
 
     def __init__(self, bearer: str) -> None:
-        self._bearer: str = bearer
+        # Use one session for all queries, so that connections are kept alive and reused
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRIES))
+        self._session.headers.update({
+            "accept": "application/json",
+            "Authorization": f"Bearer {bearer}"
+        })
+
         self._try_auth()
 
     def _query(self, endpoint: str, path_params: list[str] | None = None,
@@ -39,35 +52,21 @@ class TMDB:  # pylint: disable=too-few-public-methods
 
         path_params_str = ""
         if path_params:
-            path_params_str = "/" + "/".join(path_params)
+            path_params_str = "/" + "/".join(quote(p, safe="") for p in path_params)
 
-        query_params_str = ""
-        if query_params:
-            query_params_str = "?" + "&".join([f"{key}={value}" for key, value in query_params.items()])
+        url = f"https://api.themoviedb.org/3/{endpoint}{path_params_str}"
 
-        url = f"https://api.themoviedb.org/3/{endpoint}{path_params_str}{query_params_str}"
-
-        headers = {
-            "accept": "application/json",
-            "Authorization": f"Bearer {self._bearer}"
-        }
-
-        session = requests.Session()
-        retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504])
-        session.mount('http://', HTTPAdapter(max_retries=retries))
-        session.mount('https://', HTTPAdapter(max_retries=retries))
-
-        response = session.get(url, timeout=5, headers=headers)
+        # Let requests build and properly encode the query string
+        response = self._session.get(url, params=query_params, timeout=5)
         response.raise_for_status()
 
-        if response.text == "":
+        # Nothing to parse for these, don't even look at the body
+        if response.status_code in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED) or not response.content:
             return {}
 
-        return response.json()
+        return orjson.loads(response.content)
 
     def _try_auth(self) -> None:
-        print("Trying to authenticate with TMDB...")
-
         try:
             response = self._query("authentication")
             if "success" in response and not response["success"]:
@@ -75,12 +74,13 @@ class TMDB:  # pylint: disable=too-few-public-methods
         except (requests.exceptions.HTTPError, RuntimeError) as error:
             raise RuntimeError(f"Failed to authenticate with TMDB: {error}") from error
 
-    def get_movie(self, movie_id: int, with_releases: bool = True, language: str | None = None) -> dict[Any, Any]:
+    def get_movie(self, movie_id: int, append: list[str] | None = None, language: str | None = None) -> dict[Any, Any]:
         """! Query TMDB for details about a movie.
 
-        @param movie_id       ID of the movie on TMDB.
-        @param with_releases  Add information about releases of the movie.
-        @param language       For which language to query.
+        @param movie_id  ID of the movie on TMDB.
+        @param append    Additional information to append to the response in the same request
+                         (for example "release_dates" or "credits").
+        @param language  For which language to query.
 
         @return A dict with details about the movie.
         """
@@ -91,8 +91,8 @@ class TMDB:  # pylint: disable=too-few-public-methods
             assert query_params is not None
             if language is not None:
                 query_params["language"] = language
-            if with_releases:
-                query_params["append_to_response"] = "release_dates"
+            if append:
+                query_params["append_to_response"] = ",".join(append)
 
             if not query_params:
                 query_params = None
@@ -103,10 +103,12 @@ class TMDB:  # pylint: disable=too-few-public-methods
         except requests.exceptions.HTTPError as error:
             raise RuntimeError(f"Failed to get movie: {error}") from error
 
-    def get_show(self, show_id: int, language: str | None = None) -> dict[Any, Any]:
+    def get_show(self, show_id: int, append: list[str] | None = None, language: str | None = None) -> dict[Any, Any]:
         """! Query TMDB for details about a show.
 
         @param show_id   ID of the show on TMDB.
+        @param append    Additional information to append to the response in the same request
+                         (for example "external_ids" or "credits").
         @param language  For which language to query.
 
         @return A dict with details about the show.
@@ -118,6 +120,8 @@ class TMDB:  # pylint: disable=too-few-public-methods
             assert query_params is not None
             if language is not None:
                 query_params["language"] = language
+            if append:
+                query_params["append_to_response"] = ",".join(append)
 
             if not query_params:
                 query_params = None
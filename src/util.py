@@ -21,6 +21,7 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import email.utils
+import functools
 from importlib import metadata
 from typing import Any
 
@@ -33,9 +34,12 @@ class Util:  # pylint: disable=too-few-public-methods
     """
 
     @staticmethod
+    @functools.cache
     def get_project_info() -> dict[str, Any]:
         """! Get project metadata information.
 
+        The information is only read once and then cached, since it can't change while running.
+
         @return A dict containing project metadata information.
         """
         project_metadata = metadata.metadata(PACKAGE_NAME)
@@ -52,10 +56,9 @@ class Util:  # pylint: disable=too-few-public-methods
             parsed = i.split(", ", 1)
             info["url"][parsed[0]] = parsed[1]
 
-        # Authors are stored in an email address format, pasted together into one string
-        info["authors"] = []
-        for address in project_metadata["Author-email"].split(", "):
-            parsed = email.utils.parseaddr(address)
-            info["authors"].append(f"{parsed[0]} <{parsed[1]}>")
+        # Authors are stored in an email address format, pasted together into one string.
+        # Parse them in one go; splitting on ", " would break on names containing commas
+        authors = email.utils.getaddresses(project_metadata.get_all("Author-email") or [])
+        info["authors"] = [f"{name} <{address}>" for name, address in authors]
 
         return info